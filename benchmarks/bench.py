@@ -0,0 +1,283 @@
+"""Benchmarks for pytest-fastest's tracer, store, selection, and Git backend.
+
+Each benchmark runs against a synthetic project of generated modules and tests.
+Results are printed as JSON, and can be compared against an earlier run. The comparison is
+printed on stderr, so stdout stays valid JSON:
+
+    $ python benchmarks/bench.py --output before.json
+    $ git checkout my-branch
+    $ python benchmarks/bench.py --compare before.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import pathlib
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from typing import Dict, Iterator, List
+from unittest import mock
+
+import pytest_fastest
+from pytest_fastest import git, stats, store
+
+
+def generate_project(root: pathlib.Path, modules: int, tests: int, fanout: int, seed: int):
+    """Write a project where each test calls into `fanout` of the generated modules."""
+
+    rng = random.Random(seed)
+    package = root / "synthetic"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    for index in range(modules):
+        (package / "mod_{}.py".format(index)).write_text(
+            "def func(value):\n    return value + {}\n".format(index)
+        )
+
+    test_dir = root / "tests"
+    test_dir.mkdir()
+    per_file = 100
+    for start in range(0, tests, per_file):
+        lines = []
+        for index in range(start, min(start + per_file, tests)):
+            targets = rng.sample(range(modules), min(fanout, modules))
+            lines.append("def test_{}():".format(index))
+            for target in targets:
+                lines.append("    from synthetic import mod_{0}; mod_{0}.func(1)".format(target))
+            lines.append("")
+        (test_dir / "test_{}.py".format(start // per_file)).write_text("\n".join(lines))
+
+
+def synthetic_coverage(root: pathlib.Path, args) -> Dict[str, Dict]:
+    """Build coverage data shaped like the generated project's."""
+
+    rng = random.Random(args.seed)
+    module_files = [str(root / "synthetic" / "mod_{}.py".format(i)) for i in range(args.modules)]
+    # Parametrized tests share their dependency sets, so only some of the sets are distinct
+    shared = [
+        sorted(rng.sample(module_files, min(args.fanout, args.modules)))
+        for _ in range(max(1, args.tests // args.params))
+    ]
+
+    coverage = {}
+    for index in range(args.tests):
+        fspath = str(root / "tests" / "test_{}.py".format(index // 100))
+        coverage["tests/test_{}.py::test_{}".format(index // 100, index)] = {
+            "files": shared[index // args.params],
+            "fspath": fspath,
+            # The synthetic modules aren't installed distributions, so there are no versions
+            "packages": {},
+            "duration": 0.01,
+            "timestamp": 0.0,
+        }
+    return coverage
+
+
+@contextlib.contextmanager
+def timer(results: Dict, name: str) -> Iterator[Dict]:
+    """Record the wall time of the wrapped block under results[name]."""
+
+    entry = results.setdefault(name, {})
+    start = time.perf_counter()
+    yield entry
+    entry["seconds"] = time.perf_counter() - start
+
+
+def peak_memory(func, *args) -> int:
+    """Call func with args under tracemalloc, and get the peak number of bytes it allocated."""
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_tracer(root: pathlib.Path, args, results: Dict):
+    """Measure the cost that the tracer adds to each function call."""
+
+    sys.path.insert(0, str(root))
+    try:
+        # pylint: disable=import-error,import-outside-toplevel
+        from synthetic import mod_0  # type: ignore
+    finally:
+        sys.path.pop(0)
+
+    calls = args.calls
+    start = time.perf_counter()
+    for _ in range(calls):
+        mod_0.func(1)
+    plain = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with pytest_fastest.tracer(str(root), "", ("/nonexistent/site-packages/",)):
+        for _ in range(calls):
+            mod_0.func(1)
+    traced = time.perf_counter() - start
+
+    results["tracer"] = {
+        "calls": calls,
+        "seconds": traced,
+        "overhead_per_call_ns": (traced - plain) / calls * 1e9,
+    }
+
+
+def bench_store(root: pathlib.Path, args, results: Dict):
+    """Measure saving and loading the coverage store."""
+
+    coverage = synthetic_coverage(root, args)
+    cwd = os.getcwd()
+    os.chdir(str(root))
+    try:
+        # tracemalloc slows down allocation-heavy code several times over, so each call is
+        # timed on its own and then repeated under tracemalloc to measure its peak memory
+        with timer(results, "save_coverage") as entry:
+            store.save_coverage(coverage)
+        entry["bytes"] = os.path.getsize(store.STOREFILE)
+        os.remove(store.STOREFILE)
+        entry["peak_bytes"] = peak_memory(store.save_coverage, coverage)
+
+        with timer(results, "load_coverage") as entry:
+            loaded = store.load_coverage()
+        entry["peak_bytes"] = peak_memory(store.load_coverage)
+    finally:
+        os.chdir(cwd)
+
+    assert len(loaded) == len(coverage)
+
+
+def bench_selection(root: pathlib.Path, args, results: Dict):
+    """Measure marking unaffected tests as skippable."""
+
+    coverage = synthetic_coverage(root, args)
+    changed_files = {
+        str(root / "synthetic" / "mod_{}.py".format(index))
+        for index in range(min(args.changed, args.modules))
+    }
+
+    items: List[types.SimpleNamespace] = []
+    for nodeid, covdata in coverage.items():
+        items.append(
+            types.SimpleNamespace(
+                nodeid=nodeid,
+                fspath=covdata["fspath"],
+                name=nodeid.rpartition("::")[2],
+                add_marker=lambda marker: None,
+            )
+        )
+    config = types.SimpleNamespace(
+        cache=types.SimpleNamespace(
+            fastest_skip=True,
+            fastest_mode="skip",
+            fastest_commit="HEAD",
+            fastest_project=None,
+            fastest_shard=None,
+            fastest_stats=stats.Stats(),
+        )
+    )
+
+    pytest_fastest.COVERAGE.clear()
+    pytest_fastest.COVERAGE.update(coverage)
+    try:
+        with mock.patch.object(git, "changes_since", return_value=(changed_files, set())):
+            with timer(results, "pytest_collection_modifyitems") as entry:
+                pytest_fastest.pytest_collection_modifyitems(config, items)
+    finally:
+        pytest_fastest.COVERAGE.clear()
+    entry["items"] = len(items)
+    entry["skipped"] = config.cache.fastest_stats.skipped
+
+
+def bench_git(root: pathlib.Path, args, results: Dict):
+    """Measure parsing a diff that touches many files."""
+
+    def run(*command):
+        subprocess.check_call(["git", *command], cwd=str(root), stdout=subprocess.DEVNULL)
+
+    run("init", "-q")
+    run("add", ".")
+    run("-c", "user.name=bench", "-c", "user.email=bench@example.com", "commit", "-qm", "base")
+    for index in range(min(args.changed, args.modules)):
+        path = root / "synthetic" / "mod_{}.py".format(index)
+        path.write_text(path.read_text() + "\n\ndef test_added():\n    pass\n")
+
+    cwd = os.getcwd()
+    os.chdir(str(root))
+    try:
+        with timer(results, "git.changes_since") as entry:
+            changed_files, _ = git.changes_since("HEAD")
+    finally:
+        os.chdir(cwd)
+    entry["changed_files"] = len(changed_files)
+
+
+def compare(results: Dict, baseline: Dict):
+    """Print how each timing changed relative to the baseline, on stderr to keep stdout JSON."""
+
+    for name, entry in sorted(results["results"].items()):
+        try:
+            before = baseline["results"][name]["seconds"]
+        except KeyError:
+            continue
+        after = entry["seconds"]
+        ratio = after / before if before else float("inf")
+        print(
+            "{:32} {:10.4f}s -> {:10.4f}s  ({:.2f}x)".format(name, before, after, ratio),
+            file=sys.stderr,
+        )
+
+
+def main():
+    """Run the benchmarks."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", type=int, default=500, help="Number of source modules")
+    parser.add_argument("--tests", type=int, default=10000, help="Number of tests")
+    parser.add_argument("--fanout", type=int, default=20, help="Modules called by each test")
+    parser.add_argument(
+        "--params", type=int, default=50, help="Tests sharing each dependency set"
+    )
+    parser.add_argument("--changed", type=int, default=200, help="Modules changed in the diff")
+    parser.add_argument("--calls", type=int, default=200000, help="Calls made under the tracer")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", help="Write the results to this file instead of stdout")
+    parser.add_argument("--compare", help="Compare the results against this earlier output")
+    args = parser.parse_args()
+
+    results = {
+        "params": {
+            key: getattr(args, key)
+            for key in ("modules", "tests", "fanout", "params", "changed", "calls", "seed")
+        },
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "results": {},
+    }  # type: Dict
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = pathlib.Path(tmp).resolve()
+        generate_project(root, args.modules, args.tests, args.fanout, args.seed)
+        for bench in (bench_tracer, bench_store, bench_selection, bench_git):
+            bench(root, args, results["results"])
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as outfile:
+            outfile.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            compare(results, json.load(infile))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,24 +4,35 @@
 
 import contextlib
 import enum
+import functools
+import heapq
 import json
+import math
+import os
 import pathlib
 import sys
-from typing import Dict, List, Set, Tuple  # noqa: F401, pylint: disable=unused-import
-
-import pytest
-
-try:
-    from _pytest.config import ArgumentError
-except ImportError:
-    from _pytest.config.argparsing import ArgumentError
-from _pytest.runner import runtestprotocol
-
-from . import git
-
-STOREFILE = ".fastest.coverage"
-COVERAGE = {}  # type: Dict[str, List[str]]
-STOREVERSION = 1
+import time
+from typing import Dict, List, Optional, Set, Tuple  # noqa: F401, pylint: disable=unused-import
+
+from . import git, packages, stats
+from .store import (
+    STOREFILE,
+    Reason,
+    Selector,
+    load_coverage,
+    project_pathspecs,
+    save_coverage,
+)
+
+# pytest is imported inside the hooks that need it rather than here, so that the pytest-fastest
+# command doesn't pay for importing it.
+
+COVERAGE = {}  # type: Dict[str, Dict]
+# Tests whose coverage data this run gathered. Only these are merged into the store, so that
+# data loaded at startup never overwrites what parallel runs have saved since.
+UPDATED = set()  # type: Set[str]
+# When each test that failed was removed from COVERAGE
+REMOVED = {}  # type: Dict[str, float]
 
 
 # Configuration
@@ -38,6 +49,8 @@ class Mode(enum.Enum):
     GATHER = "gather"
     # Skip tests, but don't gather coverage data
     CACHE = "cache"
+    # Skip tests, and update coverage data on a fraction of the ones that do run
+    SAMPLE = "sample"
 
 
 def pytest_addoption(parser):
@@ -56,6 +69,8 @@ def pytest_addoption(parser):
             " `skip` skips tests that can be skipped, and updates coverage data on the rest."
             " `gather` runs all tests and gathers coverage data on them."
             " `cache` skips tests and does not collect coverage data."
+            " `sample` skips tests that can be skipped, and updates coverage data on a fraction"
+            " of the rest."
         ),
     )
     group.addoption(
@@ -64,23 +79,83 @@ def pytest_addoption(parser):
         dest="fastest_commit",
         help="Git commit to compare current work against.",
     )
+    group.addoption(
+        "--fastest-project",
+        action="store",
+        dest="fastest_project",
+        help=(
+            "Directory of the project to test within a larger Git repository, relative to the"
+            " rootdir. Its coverage data is stored in that directory, and only the files its tests"
+            " depend on are diffed."
+        ),
+    )
+    group.addoption(
+        "--fastest-sample-rate",
+        action="store",
+        dest="fastest_sample_rate",
+        help="Fraction of the tests that run in sample mode to gather coverage data on.",
+    )
+    group.addoption(
+        "--fastest-shard",
+        action="store",
+        dest="fastest_shard",
+        metavar="INDEX/COUNT",
+        help=(
+            "Run only this shard's share of the tests that need to run, such as 2/12 for the"
+            " second of 12 shards. Tests are balanced across shards by their recorded durations."
+        ),
+    )
+    group.addoption(
+        "--fastest-report",
+        action="store_true",
+        dest="fastest_report",
+        help="Show where pytest-fastest spent its time, and which tests it selected and why.",
+    )
+    group.addoption(
+        "--fastest-report-json",
+        action="store",
+        dest="fastest_report_json",
+        metavar="PATH",
+        help="Write the pytest-fastest report to PATH as JSON.",
+    )
 
     parser.addini("fastest_commit", "Git commit to compare current work against")
+    parser.addini(
+        "fastest_project",
+        "Directory of the project to test within a larger Git repository, relative to the rootdir",
+    )
+    parser.addini(
+        "fastest_sample_rate",
+        "Fraction of the tests that run in sample mode to gather coverage data on",
+        default="0.1",
+    )
 
 
 # Helpers
 
 
 @contextlib.contextmanager
-def tracer(rootdir: str, own_file: str):
-    """Collect call graphs for modules within the rootdir."""
+def tracer(
+    rootdir: str,
+    own_file: str,
+    package_dirs: Tuple[str, ...] = (),
+    fastest_stats: Optional[stats.Stats] = None,
+):
+    """Collect call graphs for modules within the rootdir or any of the package_dirs.
+
+    If fastest_stats is given, the number of calls the tracer saw is added to its trace_calls.
+    """
 
     result = set()
-    base_path = str(pathlib.Path(rootdir))
+    base_paths = (str(pathlib.Path(rootdir)), *package_dirs)
+    calls = 0
 
     def trace_calls(frame, event, arg):  # pylint: disable=unused-argument
         """settrace calls this every time something interesting happens."""
 
+        nonlocal calls
+        calls += 1
+
         if event != "call":
             return
 
@@ -89,7 +164,7 @@ def tracer(rootdir: str, own_file: str):
             return
         if not func_filename.endswith(".py"):
             return
-        if not func_filename.startswith(base_path):
+        if not func_filename.startswith(base_paths):
             return
 
         result.add(func_filename)
@@ -100,31 +175,115 @@ def tracer(rootdir: str, own_file: str):
         yield result
     finally:
         sys.settrace(oldtrace)  # type: ignore
-
-
-def load_coverage():
-    """Load the coverage data from disk."""
-
-    try:
-        with open(STOREFILE, "r") as infile:
-            data = json.load(infile)
-    except FileNotFoundError:
-        return {}
-
-    try:
-        if data["version"] != STOREVERSION:
-            return {}
-    except KeyError:
-        return {}
-
-    return data["coverage"]
-
-
-def save_coverage(coverage):
-    """Save the coverage data to disk."""
-
-    with open(STOREFILE, "w") as outfile:
-        json.dump({"coverage": coverage, "version": STOREVERSION}, outfile, indent=2)
+        if fastest_stats is not None:
+            fastest_stats.trace_calls += calls
+
+
+@functools.lru_cache(maxsize=None)
+def tracer_cost(calls: int = 100000) -> float:
+    """Estimate how many seconds the tracer adds to each function call it sees."""
+
+    def noop():
+        pass
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        noop()
+    plain = time.perf_counter() - start
+
+    # noop is in this file, so the tracer records it like a call into the project
+    start = time.perf_counter()
+    with tracer(os.path.dirname(__file__), ""):
+        for _ in range(calls):
+            noop()
+    traced = time.perf_counter() - start
+
+    return max(0.0, (traced - plain) / calls)
+
+
+def sample_nodes(coverage, selected: List[Tuple[str, Reason]], rate: float) -> Set[str]:
+    """Choose a fraction of the selected tests to trace, preferring those with the stalest data.
+
+    Tests without coverage data come first, then tests that were changed, then the rest from
+    the oldest data to the newest.
+    """
+
+    def staleness(selection):
+        nodeid, reason = selection
+        if reason is Reason.NO_COVERAGE:
+            return (0, 0.0, nodeid)
+        if reason is Reason.TEST_CHANGED:
+            return (1, 0.0, nodeid)
+        return (2, coverage[nodeid]["timestamp"], nodeid)
+
+    budget = math.ceil(rate * len(selected))
+    return {nodeid for nodeid, _ in sorted(selected, key=staleness)[:budget]}
+
+
+def fixture_group(item, shared: str = "") -> str:
+    """Get the nodeid prefix shared by the tests that share the item's widest-scoped fixtures.
+
+    Package-scoped fixtures group every test in the package that defines them. Session-scoped
+    fixtures are set up once per shard however the tests are split, so they're ignored, as are
+    package-scoped fixtures of the packages that hold the shared directory, which is the
+    deepest one holding every running test. Those are shared just as widely.
+    """
+
+    scopes = set()
+    packages_used = set()
+    fixtureinfo = getattr(item, "_fixtureinfo", None)
+    if fixtureinfo is not None:
+        for fixturedefs in fixtureinfo.name2fixturedefs.values():
+            fixturedef = fixturedefs[-1]
+            scope = str(fixturedef.scope)
+            if scope == "package":
+                baseid = getattr(fixturedef, "baseid", "")
+                if baseid and not (shared + "/").startswith(baseid + "/"):
+                    packages_used.add(baseid)
+            else:
+                scopes.add(scope)
+
+    if packages_used:
+        return min(packages_used, key=len)
+    if "module" in scopes:
+        return item.nodeid.partition("::")[0]
+    if "class" in scopes:
+        return item.nodeid.rpartition("::")[0]
+    return item.nodeid
+
+
+def shared_directory(items) -> str:
+    """Get the deepest directory, as a nodeid, that holds all of the items."""
+
+    shared = None  # type: Optional[List[str]]
+    for item in items:
+        parts = item.nodeid.partition("::")[0].split("/")[:-1]
+        if shared is None:
+            shared = parts
+        else:
+            length = 0
+            for ours, theirs in zip(shared, parts):
+                if ours != theirs:
+                    break
+                length += 1
+            shared = shared[:length]
+    return "/".join(shared or [])
+
+
+def assign_shards(durations: Dict[str, float], count: int) -> Dict[str, int]:
+    """Assign each group of tests to one of count shards so that their total durations even out.
+
+    The longest groups are placed first, each on the shard with the least work so far. Ties are
+    broken by group key and shard number, so every shard computes the same assignment.
+    """
+
+    loads = [(0.0, index) for index in range(count)]
+    assignments = {}
+    for key, duration in sorted(durations.items(), key=lambda pair: (-pair[1], pair[0])):
+        load, index = heapq.heappop(loads)
+        assignments[key] = index
+        heapq.heappush(loads, (load + duration, index))
+    return assignments
 
 
 # Hooks
@@ -133,57 +292,181 @@ def save_coverage(coverage):
 def pytest_configure(config):
     """Process the configuration."""
 
+    import pytest  # pylint: disable=import-outside-toplevel
+
     config.cache.fastest_commit = config.getoption("fastest_commit") or config.getini(
         "fastest_commit"
     )
     config.cache.fastest_mode = config.getoption("fastest_mode")
+    config.cache.fastest_stats = stats.Stats()
+
+    project = config.getoption("fastest_project") or config.getini("fastest_project")
+    if project:
+        # Tests may depend on code anywhere in the repository, not just in their project
+        config.cache.fastest_project = str(pathlib.Path(str(config.rootdir), project).resolve())
+        config.cache.fastest_store = os.path.join(config.cache.fastest_project, STOREFILE)
+    else:
+        config.cache.fastest_project = None
+        config.cache.fastest_store = STOREFILE
 
     config.cache.fastest_skip, config.cache.fastest_gather = {
         Mode.ALL.value: (False, False),
         Mode.SKIP.value: (True, True),
         Mode.GATHER.value: (False, True),
         Mode.CACHE.value: (True, False),
+        Mode.SAMPLE.value: (True, True),
     }[config.cache.fastest_mode]
 
+    # The tests to gather coverage data on, or None for all of them
+    config.cache.fastest_trace = None
+    if config.cache.fastest_mode == Mode.SAMPLE.value:
+        rate = config.getoption("fastest_sample_rate") or config.getini("fastest_sample_rate")
+        try:
+            config.cache.fastest_sample_rate = float(rate)
+        except ValueError:
+            config.cache.fastest_sample_rate = -1.0
+        if not 0.0 < config.cache.fastest_sample_rate <= 1.0:
+            raise pytest.UsageError(
+                "fastest_sample_rate must be greater than 0 and at most 1, not {}.".format(rate)
+            )
+
+    shard = config.getoption("fastest_shard")
+    if shard:
+        try:
+            index, count = (int(part) for part in shard.split("/"))
+        except ValueError:
+            index = count = 0
+        if not 1 <= index <= count:
+            raise pytest.UsageError("fastest_shard must look like 2/12, not {}.".format(shard))
+        config.cache.fastest_shard = (index, count)
+    else:
+        config.cache.fastest_shard = None
+
     if config.cache.fastest_skip and not config.cache.fastest_commit:
-        raise ArgumentError(
-            "fastest_mode",
-            "Mode {} requires fastest_commit to be set.".format(config.cache.fastest_mode),
+        raise pytest.UsageError(
+            "Mode {} requires fastest_commit to be set.".format(config.cache.fastest_mode)
         )
 
     COVERAGE.clear()
-    if config.cache.fastest_gather or config.cache.fastest_skip:
-        COVERAGE.update(load_coverage())
+    UPDATED.clear()
+    REMOVED.clear()
+    if config.cache.fastest_gather or config.cache.fastest_skip or config.cache.fastest_shard:
+        with config.cache.fastest_stats.timed("load coverage"):
+            COVERAGE.update(load_coverage(config.cache.fastest_store))
+
+    if config.cache.fastest_gather and config.cache.fastest_project:
+        config.cache.fastest_trace_root = str(git.find_toplevel())
+    else:
+        config.cache.fastest_trace_root = str(config.rootdir)
 
 
-def pytest_collection_modifyitems(config, items):
-    """Mark unaffected tests as skippable."""
+def mark_skippable(config, items) -> Dict[str, Reason]:
+    """Mark unaffected tests as skippable, and get the reason each of the others needs to run."""
 
-    if not config.cache.fastest_skip:
-        return None
+    fastest_stats = config.cache.fastest_stats
+    with fastest_stats.timed("git diff"):
+        if config.cache.fastest_project:
+            pathspecs = project_pathspecs(COVERAGE, config.cache.fastest_project)
+        else:
+            pathspecs = []
+        changed_files, changed_tests = git.changes_since(config.cache.fastest_commit, pathspecs)
 
-    covered_test_files = {covdata["fspath"] for covdata in COVERAGE.values()}
-    changed_files, changed_tests = git.changes_since(config.cache.fastest_commit)
-
-    affected_nodes = set()
-    for nodeid, covdata in COVERAGE.items():
-        if any(fname in changed_files for fname in covdata["files"]):
-            affected_nodes.add(nodeid)
+    import pytest  # pylint: disable=import-outside-toplevel
 
     skip = pytest.mark.skip(reason="skipper")
 
-    for item in items:
-        if not any(
-            (
-                # Tests refer to modules that have changed
-                item.nodeid in affected_nodes,
-                # Tests that we don't already have coverage data for
-                str(item.fspath) not in covered_test_files,
-                # Tests that have themselves been changed
-                (str(item.fspath), item.name) in changed_tests,
+    with fastest_stats.timed("selection"):
+        selector = Selector(COVERAGE, changed_files, changed_tests)
+        reasons = {}
+        for item in items:
+            reason = selector.reason(item.nodeid, str(item.fspath))
+            if reason is None:
+                item.add_marker(skip)
+            else:
+                reasons[item.nodeid] = reason
+
+    return reasons
+
+
+def count_selection(config, items, reasons: Dict[str, Reason]):
+    """Count why the items run or are skipped, and choose the ones to sample in sample mode.
+
+    This runs after sharding, so each shard only reports on, and samples from, its own tests.
+    """
+
+    fastest_stats = config.cache.fastest_stats
+    with fastest_stats.timed("selection"):
+        selected = []
+        for item in items:
+            try:
+                reason = reasons[item.nodeid]
+            except KeyError:
+                fastest_stats.skipped += 1
+                fastest_stats.saved += COVERAGE[item.nodeid]["duration"]
+            else:
+                fastest_stats.selected[reason.value] += 1
+                selected.append((item.nodeid, reason))
+
+        if config.cache.fastest_mode == Mode.SAMPLE.value:
+            config.cache.fastest_trace = sample_nodes(
+                COVERAGE, selected, config.cache.fastest_sample_rate
             )
-        ):
-            item.add_marker(skip)
+
+
+def keep_shard(config, items, running):
+    """Deselect the tests that belong to other shards."""
+
+    index, count = config.cache.fastest_shard
+    fastest_stats = config.cache.fastest_stats
+
+    with fastest_stats.timed("sharding"):
+        known = [COVERAGE[item.nodeid]["duration"] for item in running if item.nodeid in COVERAGE]
+        # Guess that tests without recorded durations take as long as the average test
+        default = sum(known) / len(known) if known else 1.0
+
+        shared = shared_directory(running)
+        groups = {}  # type: Dict[str, float]
+        for item in running:
+            key = fixture_group(item, shared)
+            try:
+                duration = COVERAGE[item.nodeid]["duration"]
+            except KeyError:
+                duration = default
+            groups[key] = groups.get(key, 0.0) + duration
+        assignments = assign_shards(groups, count)
+
+        keep = {
+            item for item in running if assignments[fixture_group(item, shared)] == index - 1
+        }
+        # Report the skipped tests once, on the first shard, rather than on every shard
+        if index == 1:
+            keep.update(set(items) - set(running))
+
+        deselected = [item for item in items if item not in keep]
+        items[:] = [item for item in items if item in keep]
+
+    if deselected:
+        fastest_stats.deselected += len(deselected)
+        config.hook.pytest_deselected(items=deselected)
+
+
+def pytest_collection_modifyitems(config, items):
+    """Mark unaffected tests as skippable, and keep only this shard's share of the rest."""
+
+    if not (config.cache.fastest_skip or config.cache.fastest_shard):
+        return None
+
+    if config.cache.fastest_skip:
+        reasons = mark_skippable(config, items)
+        running = [item for item in items if item.nodeid in reasons]
+    else:
+        running = list(items)
+
+    if config.cache.fastest_shard:
+        keep_shard(config, items, running)
+
+    if config.cache.fastest_skip:
+        count_selection(config, items, reasons)
 
     return True
 
@@ -194,7 +477,22 @@ def pytest_runtest_protocol(item, nextitem):
     if not item.config.cache.fastest_gather:
         return None
 
-    with tracer(item.config.rootdir, str(item.fspath)) as coverage:
+    from _pytest.runner import runtestprotocol  # pylint: disable=import-outside-toplevel
+
+    fastest_stats = item.config.cache.fastest_stats
+    trace = item.config.cache.fastest_trace
+    traced = trace is None or item.nodeid in trace
+    package_dirs = packages.site_dirs()
+    if traced:
+        with fastest_stats.timed("traced test runs"):
+            with tracer(
+                item.config.cache.fastest_trace_root,
+                str(item.fspath),
+                package_dirs,
+                fastest_stats,
+            ) as coverage:
+                reports = runtestprotocol(item, nextitem=nextitem)
+    else:
         reports = runtestprotocol(item, nextitem=nextitem)
 
     item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
@@ -202,10 +500,25 @@ def pytest_runtest_protocol(item, nextitem):
     outcomes = {report.when: report.outcome for report in reports}
     if outcomes["setup"] in {"failed", "skipped"}:
         return True
-
-    if outcomes["call"] == "passed":
-        COVERAGE[item.nodeid] = {"files": sorted(coverage), "fspath": str(item.fspath)}
-    else:
+    if traced:
+        fastest_stats.traced += 1
+
+    # Passing tests that weren't sampled keep their existing coverage data
+    if outcomes["call"] == "passed" and traced:
+        # Modules imported through relative sys.path entries have paths like a/../b/c.py
+        files = {os.path.normpath(fname) for fname in coverage}
+        installed = {fname for fname in files if fname.startswith(package_dirs)}
+        COVERAGE[item.nodeid] = {
+            "files": sorted(files - installed),
+            "fspath": str(item.fspath),
+            "packages": packages.versions_for(installed),
+            "duration": sum(report.duration for report in reports),
+            "timestamp": time.time(),
+        }
+        UPDATED.add(item.nodeid)
+    elif outcomes["call"] != "passed":
+        REMOVED[item.nodeid] = time.time()
+        UPDATED.discard(item.nodeid)
         try:
             del COVERAGE[item.nodeid]
         except KeyError:
@@ -215,7 +528,30 @@ def pytest_runtest_protocol(item, nextitem):
 
 
 def pytest_terminal_summary(terminalreporter, exitstatus):  # pylint: disable=unused-argument
-    """Save the coverage data we've collected."""
+    """Save the coverage data we've collected, and report on how it went."""
+
+    config = terminalreporter.config
+    fastest_stats = config.cache.fastest_stats
+
+    if config.cache.fastest_gather and (UPDATED or REMOVED):
+        updated = {nodeid: COVERAGE[nodeid] for nodeid in UPDATED}
+        with fastest_stats.timed("save coverage"):
+            save_coverage(updated, config.cache.fastest_store, REMOVED)
 
-    if COVERAGE:
-        save_coverage(COVERAGE)
+    report_json = config.getoption("fastest_report_json")
+    if not (config.getoption("fastest_report") or report_json):
+        return
+
+    if fastest_stats.trace_calls:
+        fastest_stats.tracing_overhead = fastest_stats.trace_calls * tracer_cost()
+
+    if config.getoption("fastest_report"):
+        terminalreporter.write_sep("-", "pytest-fastest report")
+        for line in fastest_stats.lines():
+            terminalreporter.write_line(line)
+
+    if report_json:
+        with open(report_json, "w") as outfile:
+            json.dump(
+                {**fastest_stats.as_dict(), "mode": config.cache.fastest_mode}, outfile, indent=2
+            )
@@ -0,0 +1,136 @@
+"""Answer questions about test selection from the coverage data, without running pytest."""
+
+import argparse
+import json
+import os
+import pathlib
+import sys
+from typing import Dict, List, Optional, Sequence
+
+from . import git
+from .store import STOREFILE, Selector, load_coverage, project_pathspecs
+
+
+def depends(coverage: Dict[str, Dict], filenames: List[str]) -> Dict[str, List[str]]:
+    """Get the tests that depend on each of the given files."""
+
+    result = {}
+    for filename in filenames:
+        path = os.path.abspath(filename)
+        result[filename] = sorted(
+            nodeid
+            for nodeid, covdata in coverage.items()
+            if covdata["fspath"] == path or path in covdata["files"]
+        )
+    return result
+
+
+def explain(
+    coverage: Dict[str, Dict],
+    commit: str,
+    nodeids: List[str],
+    pathspecs: Sequence[str] = (),
+    check_packages: bool = True,
+) -> Dict[str, Optional[str]]:
+    """Get the reason each of the given tests would run against the commit, or None to skip it."""
+
+    selector = Selector(coverage, *git.changes_since(commit, pathspecs), check_packages)
+    result = {}
+    for nodeid in nodeids:
+        try:
+            fspath = coverage[nodeid]["fspath"]
+        except KeyError:
+            fspath = ""
+        reason = selector.reason(nodeid, fspath)
+        result[nodeid] = None if reason is None else reason.value
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the command line interface."""
+
+    parser = argparse.ArgumentParser(prog="pytest-fastest", description=__doc__)
+    parser.add_argument(
+        "--rootdir",
+        default=".",
+        help="Directory that --project is relative to, like pytest's rootdir. Defaults to `.`.",
+    )
+    parser.add_argument(
+        "--project",
+        help=(
+            "Directory of the project within a larger Git repository, relative to --rootdir."
+            " This matches --fastest-project, which is relative to pytest's rootdir."
+        ),
+    )
+    parser.add_argument(
+        "--store",
+        help=(
+            "Coverage data file to read."
+            " Defaults to {} in the project or current directory.".format(STOREFILE)
+        ),
+    )
+    parser.add_argument("--json", action="store_true", help="Write the results as JSON.")
+    parser.add_argument(
+        "--ignore-packages",
+        action="store_true",
+        help=(
+            "Don't check whether installed distributions have changed. Their versions are read"
+            " from the interpreter running this command, so use this when it isn't the one that"
+            " runs the tests, as in an isolated pre-commit hook."
+        ),
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    depends_parser = subparsers.add_parser("depends", help="List the tests that depend on files.")
+    depends_parser.add_argument("files", nargs="+", metavar="FILE")
+
+    explain_parser = subparsers.add_parser(
+        "explain", help="Explain why tests would run or be skipped against a commit."
+    )
+    explain_parser.add_argument("--commit", required=True, help="Git commit to compare against.")
+    explain_parser.add_argument("nodeids", nargs="+", metavar="NODEID")
+
+    select_parser = subparsers.add_parser(
+        "select",
+        help="List the tests with coverage data that would run against a commit, and why.",
+    )
+    select_parser.add_argument("--commit", required=True, help="Git commit to compare against.")
+
+    args = parser.parse_args(argv)
+    if args.project:
+        project = str(pathlib.Path(args.rootdir, args.project).resolve())
+        coverage = load_coverage(args.store or os.path.join(project, STOREFILE))
+        pathspecs = project_pathspecs(coverage, project)
+    else:
+        coverage = load_coverage(args.store or STOREFILE)
+        pathspecs = []
+
+    if args.command == "depends":
+        result = depends(coverage, args.files)  # type: Dict
+    elif args.command == "explain":
+        result = explain(
+            coverage, args.commit, args.nodeids, pathspecs, not args.ignore_packages
+        )
+    else:
+        reasons = explain(
+            coverage, args.commit, sorted(coverage), pathspecs, not args.ignore_packages
+        )
+        result = {nodeid: reason for nodeid, reason in reasons.items() if reason is not None}
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif args.command == "depends":
+        for filename, nodeids in result.items():
+            for nodeid in nodeids:
+                print("{}: {}".format(filename, nodeid))
+    else:
+        for nodeid, reason in result.items():
+            print("{}: {}".format(nodeid, reason or "skip"))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,7 @@
 
 import pathlib
 import subprocess
-from typing import List, Set, Tuple
+from typing import List, Sequence, Set, Tuple
 
 
 def cmd_output(args: List[str]) -> str:
@@ -17,11 +17,13 @@ def find_toplevel() -> pathlib.Path:
     return pathlib.Path(cmd_output(["rev-parse", "--show-toplevel"]).strip())
 
 
-def changes_since(commit: str) -> Tuple[Set[str], Set[Tuple[str, str]]]:
-    """Get the set of changes between the given commit."""
+def changes_since(
+    commit: str, pathspecs: Sequence[str] = ()
+) -> Tuple[Set[str], Set[Tuple[str, str]]]:
+    """Get the set of changes between the given commit, optionally limited to the pathspecs."""
 
     toplevel = find_toplevel()
-    diff = cmd_output(["diff", commit, "--"])
+    diff = cmd_output(["diff", commit, "--", *pathspecs])
 
     changed_files = set()
     changed_tests = set()
@@ -0,0 +1,118 @@
+"""Installed distribution backend for pytest-fastest."""
+
+import functools
+import importlib.metadata
+import os
+import site
+import sysconfig
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+# The distributions that run every test, rather than being called by the tests themselves
+HARNESS = {"pluggy", "pytest"}
+
+
+@functools.lru_cache(maxsize=None)
+def site_dirs() -> Tuple[str, ...]:
+    """Get the directories that third-party distributions are installed into."""
+
+    dirs = {sysconfig.get_paths()[key] for key in ("purelib", "platlib")}
+    try:
+        dirs.update(site.getsitepackages())
+    except AttributeError:
+        # Some virtualenv versions ship a site module without this function
+        pass
+    dirs.add(site.getusersitepackages())
+
+    return tuple(sorted(os.path.join(os.path.normpath(dirname), "") for dirname in dirs))
+
+
+@functools.lru_cache(maxsize=None)
+def file_owners() -> Dict[str, str]:
+    """Map every installed Python file to the name of the distribution it came from."""
+
+    owners = {}  # type: Dict[str, str]
+    for dist in importlib.metadata.distributions():
+        name = dist.metadata["Name"]
+        for path in dist.files or ():
+            if path.suffix == ".py":
+                owners.setdefault(os.path.normpath(str(dist.locate_file(path))), name)
+    return owners
+
+
+@functools.lru_cache(maxsize=None)
+def top_level_owners() -> Dict[str, str]:
+    """Map top-level module names to distribution names for installs without a file list."""
+
+    owners = {}  # type: Dict[str, str]
+    for dist in importlib.metadata.distributions():
+        name = dist.metadata["Name"]
+        for module in (dist.read_text("top_level.txt") or "").split():
+            owners.setdefault(module, name)
+    return owners
+
+
+@functools.lru_cache(maxsize=None)
+def harness_distributions() -> Set[str]:
+    """Get the names of pytest, pluggy, and the distributions that provide pytest plugins.
+
+    The tracer sees their code run around every test, so depending on them would mean that
+    upgrading any of them selects the whole suite.
+    """
+
+    names = set(HARNESS)
+    for dist in importlib.metadata.distributions():
+        if any(entry_point.group == "pytest11" for entry_point in dist.entry_points):
+            names.add(dist.metadata["Name"])
+    return names
+
+
+def owner(filename: str) -> Optional[str]:
+    """Get the name of the distribution that installed the given file, if any."""
+
+    try:
+        return file_owners()[filename]
+    except KeyError:
+        pass
+
+    for dirname in site_dirs():
+        if filename.startswith(dirname):
+            module = filename[len(dirname) :].split(os.sep)[0]
+            if module.endswith(".py"):
+                module = module[:-3]
+            return top_level_owners().get(module)
+
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def installed_version(name: str) -> Optional[str]:
+    """Get the currently installed version of the named distribution."""
+
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def versions_for(filenames: Iterable[str]) -> Dict[str, str]:
+    """Get the distributions, and their installed versions, that the given files came from.
+
+    The test harness's distributions are left out.
+    """
+
+    harness = harness_distributions()
+    versions = {}
+    for filename in filenames:
+        name = owner(filename)
+        if name is None or name in harness:
+            continue
+        version = installed_version(name)
+        if version is not None:
+            versions[name] = version
+    return dict(sorted(versions.items()))
+
+
+def changed(versions: Dict[str, str]) -> bool:
+    """Check whether any of the given distributions are no longer installed at that version."""
+
+    return any(installed_version(name) != version for name, version in versions.items())
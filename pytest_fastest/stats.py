@@ -0,0 +1,66 @@
+"""Timing and selection statistics for pytest-fastest."""
+
+import collections
+import contextlib
+import time
+from typing import Dict, Iterator, List
+
+
+class Stats:
+    """Where the plugin spent its time, and which tests it selected and why."""
+
+    def __init__(self):
+        self.timings = collections.defaultdict(float)  # type: Dict[str, float]
+        self.selected = collections.Counter()  # type: Dict[str, int]
+        self.skipped = 0
+        self.deselected = 0
+        self.saved = 0.0
+        self.traced = 0
+        self.trace_calls = 0
+        self.tracing_overhead = 0.0
+
+    @contextlib.contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        """Add the wall time of the wrapped block to the named timing."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def as_dict(self) -> Dict:
+        """Get the statistics in a JSON-serializable form."""
+
+        return {
+            "timings": dict(self.timings),
+            "selected": dict(self.selected),
+            "skipped": self.skipped,
+            "deselected": self.deselected,
+            "saved": self.saved,
+            "traced": self.traced,
+            "trace_calls": self.trace_calls,
+            "tracing_overhead": self.tracing_overhead,
+        }
+
+    def lines(self) -> List[str]:
+        """Get the statistics as human-readable lines."""
+
+        lines = ["{}: {:.3f}s".format(name, seconds) for name, seconds in self.timings.items()]
+        if self.traced:
+            lines.append("traced tests: {}".format(self.traced))
+            lines.append(
+                "traced function calls: {} (tracing overhead about {:.3f}s)".format(
+                    self.trace_calls, self.tracing_overhead
+                )
+            )
+        if self.selected or self.skipped:
+            reasons = ", ".join(
+                "{}: {}".format(reason, count) for reason, count in sorted(self.selected.items())
+            )
+            selected = sum(self.selected.values())
+            lines.append("selected: {} ({})".format(selected, reasons or "none"))
+            lines.append("skipped: {} (saving about {:.3f}s)".format(self.skipped, self.saved))
+        if self.deselected:
+            lines.append("left to other shards: {}".format(self.deselected))
+        return lines
@@ -0,0 +1,205 @@
+"""Coverage data storage and test selection for pytest-fastest.
+
+This module doesn't import pytest, so that the pytest-fastest command starts quickly.
+"""
+
+import contextlib
+import enum
+import json
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from . import packages
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+    import msvcrt
+
+STOREFILE = ".fastest.coverage"
+STOREVERSION = 5
+
+
+class Reason(enum.Enum):
+    """Enumerated reasons for running a test."""
+
+    # There's no coverage data for the test
+    NO_COVERAGE = "no coverage"
+    # The test itself has been changed
+    TEST_CHANGED = "test changed"
+    # The test calls into a module that has changed
+    DEPENDENCY_CHANGED = "dependency changed"
+    # The test calls into an installed distribution whose version has changed
+    PACKAGE_CHANGED = "package changed"
+
+
+class Selector:
+    """Decide which tests need to run, given coverage data and the changes since a commit.
+
+    Installed distributions are compared against the current interpreter's, unless
+    check_packages is false.
+    """
+
+    def __init__(
+        self,
+        coverage: Dict[str, Dict],
+        changed_files: Set[str],
+        changed_tests: Set[Tuple[str, str]],
+        check_packages: bool = True,
+    ):
+        self.coverage = coverage
+        self.changed_files = changed_files
+        self.changed_tests = changed_tests
+        self.check_packages = check_packages
+
+    def reason(self, nodeid: str, fspath: str) -> Optional[Reason]:
+        """Get the reason that the test needs to run, or None if it may be skipped."""
+
+        try:
+            covdata = self.coverage[nodeid]
+        except KeyError:
+            return Reason.NO_COVERAGE
+
+        # Parametrized tests are changed by editing the function they all share
+        test_name = nodeid.rpartition("::")[2].partition("[")[0]
+        if (fspath, test_name) in self.changed_tests:
+            return Reason.TEST_CHANGED
+
+        if any(fname in self.changed_files for fname in covdata["files"]):
+            return Reason.DEPENDENCY_CHANGED
+        if self.check_packages and packages.changed(covdata["packages"]):
+            return Reason.PACKAGE_CHANGED
+
+        return None
+
+
+def project_pathspecs(coverage, project: str) -> List[str]:
+    """Get the project directory and the directories outside it that its tests depend on.
+
+    Files in a directory that contains the project, such as the top of the repository, are
+    given on their own, since their directory would include every other project too.
+    """
+
+    prefix = os.path.join(project, "")
+    files = set().union(*(covdata["files"] for covdata in coverage.values()))
+    edges = set()
+    for fname in files:
+        if fname.startswith(prefix):
+            continue
+        dirname = os.path.dirname(fname)
+        edges.add(fname if prefix.startswith(os.path.join(dirname, "")) else dirname)
+    return [project, *sorted(edges)]
+
+
+def pack_coverage(coverage):
+    """Intern the test paths and dependency sets that tests share, and refer to them by index."""
+
+    fspaths = {}  # type: Dict[str, int]
+    dependencies = {}  # type: Dict[Tuple, int]
+    nodes = {}
+
+    for nodeid, covdata in sorted(coverage.items()):
+        key = (tuple(covdata["files"]), tuple(sorted(covdata["packages"].items())))
+        nodes[nodeid] = {
+            "fspath": fspaths.setdefault(covdata["fspath"], len(fspaths)),
+            "dependencies": dependencies.setdefault(key, len(dependencies)),
+            "duration": covdata["duration"],
+            "timestamp": covdata["timestamp"],
+        }
+
+    return {
+        "coverage": nodes,
+        "dependencies": [
+            {"files": list(files), "packages": dict(versions)} for files, versions in dependencies
+        ],
+        "fspaths": list(fspaths),
+    }
+
+
+def unpack_coverage(data):
+    """Expand packed coverage data. Tests with the same dependencies share the same objects."""
+
+    fspaths = data["fspaths"]
+    dependencies = data["dependencies"]
+
+    return {
+        nodeid: {
+            "duration": node["duration"],
+            "fspath": fspaths[node["fspath"]],
+            "timestamp": node["timestamp"],
+            **dependencies[node["dependencies"]],
+        }
+        for nodeid, node in data["coverage"].items()
+    }
+
+
+def load_coverage(path: str = STOREFILE):
+    """Load the coverage data from disk."""
+
+    try:
+        with open(path, "r") as infile:
+            data = json.load(infile)
+    except FileNotFoundError:
+        return {}
+
+    try:
+        if data["version"] != STOREVERSION:
+            return {}
+    except KeyError:
+        return {}
+
+    return unpack_coverage(data)
+
+
+@contextlib.contextmanager
+def locked(path: str):
+    """Hold an exclusive lock on the file at path while the block runs."""
+
+    with open(path, "a") as lockfile:
+        if fcntl is not None:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX)
+        else:
+            lockfile.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lockfile.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds
+                    pass
+
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lockfile.fileno(), fcntl.LOCK_UN)
+            else:
+                lockfile.seek(0)
+                msvcrt.locking(lockfile.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def merge_coverage(ours, theirs, removed: Dict[str, float]):
+    """Merge two sets of coverage data, keeping the newest entry or removal for each test."""
+
+    merged = dict(theirs)
+    for nodeid, covdata in ours.items():
+        if nodeid not in merged or merged[nodeid]["timestamp"] <= covdata["timestamp"]:
+            merged[nodeid] = covdata
+    for nodeid, timestamp in removed.items():
+        if nodeid in merged and merged[nodeid]["timestamp"] <= timestamp:
+            del merged[nodeid]
+    return merged
+
+
+def save_coverage(coverage, path: str = STOREFILE, removed: Optional[Dict[str, float]] = None):
+    """Merge the coverage data into what's on disk, so that parallel runs don't lose data."""
+
+    with locked(path + ".lock"):
+        merged = merge_coverage(coverage, load_coverage(path), removed or {})
+
+        # Readers never take the lock, so they must never see a partially written file
+        tmpfile = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmpfile, "w") as outfile:
+            json.dump({**pack_coverage(merged), "version": STOREVERSION}, outfile, indent=2)
+        os.replace(tmpfile, path)
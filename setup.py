@@ -7,7 +7,10 @@ package_data = {"": ["*"]}
 
 install_requires = ["pytest>=4.4"]
 
-entry_points = {"pytest11": ["fastest = pytest_fastest"]}
+entry_points = {
+    "console_scripts": ["pytest-fastest = pytest_fastest.cli:main"],
+    "pytest11": ["fastest = pytest_fastest"],
+}
 
 setup_kwargs = {
     "name": "pytest-fastest",
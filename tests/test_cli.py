@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pytest_fastest import cli
+from pytest_fastest.store import STOREFILE, save_coverage
+
+
+@pytest.fixture
+def store(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    src = str(tmpdir / 'src.py')
+    tests = str(tmpdir / 'test_src.py')
+    save_coverage({
+        'test_src.py::test_one': {
+            'files': [src], 'fspath': tests, 'packages': {}, 'duration': 0.1, 'timestamp': 1.0,
+        },
+        'test_src.py::test_two': {
+            'files': [], 'fspath': tests, 'packages': {}, 'duration': 0.1, 'timestamp': 1.0,
+        },
+    })
+    return src
+
+
+def test_depends(store, capsys):
+    assert cli.main(['depends', os.path.basename(store)]) == 0
+
+    assert capsys.readouterr().out == 'src.py: test_src.py::test_one\n'
+
+
+def test_explain(store, mocker, capsys):
+    mocker.patch('pytest_fastest.git.changes_since', return_value=({store}, set()))
+
+    assert cli.main([
+        '--json', 'explain', '--commit', 'abc1234',
+        'test_src.py::test_one', 'test_src.py::test_two', 'test_src.py::test_three',
+    ]) == 0
+
+    assert json.loads(capsys.readouterr().out) == {
+        'test_src.py::test_one': 'dependency changed',
+        'test_src.py::test_two': None,
+        'test_src.py::test_three': 'no coverage',
+    }
+
+
+def test_select(store, mocker, capsys):
+    mocker.patch('pytest_fastest.git.changes_since', return_value=({store}, set()))
+
+    assert cli.main(['select', '--commit', 'abc1234']) == 0
+
+    assert capsys.readouterr().out == 'test_src.py::test_one: dependency changed\n'
+
+
+def test_ignore_packages(tmpdir, monkeypatch, mocker, capsys):
+    monkeypatch.chdir(tmpdir)
+    save_coverage({
+        'test_src.py::test_one': {
+            'files': [],
+            'fspath': str(tmpdir / 'test_src.py'),
+            'packages': {'surely-not-an-installed-distribution': '1.0'},
+            'duration': 0.1,
+            'timestamp': 1.0,
+        },
+    })
+    mocker.patch('pytest_fastest.git.changes_since', return_value=(set(), set()))
+
+    assert cli.main(['select', '--commit', 'abc1234']) == 0
+    assert capsys.readouterr().out == 'test_src.py::test_one: package changed\n'
+
+    assert cli.main(['--ignore-packages', 'select', '--commit', 'abc1234']) == 0
+    assert capsys.readouterr().out == ''
+
+
+def test_cli_does_not_import_pytest():
+    subprocess.check_call([
+        sys.executable, '-c',
+        'import sys, pytest_fastest.cli; assert "pytest" not in sys.modules',
+    ])
+
+
+def test_project_relative_to_rootdir(tmpdir, monkeypatch, capsys):
+    project = tmpdir.mkdir('repo').mkdir('one')
+    src = str(project / 'src.py')
+    save_coverage(
+        {
+            'test_src.py::test_one': {
+                'files': [src],
+                'fspath': str(project / 'test_src.py'),
+                'packages': {},
+                'duration': 0.1,
+                'timestamp': 1.0,
+            },
+        },
+        str(project / STOREFILE),
+    )
+    monkeypatch.chdir(tmpdir)
+
+    assert cli.main(['--rootdir', 'repo', '--project', 'one', 'depends', src]) == 0
+
+    assert capsys.readouterr().out == '{}: test_src.py::test_one\n'.format(src)
@@ -112,3 +112,22 @@ index ddc9bcb..03d9e26 100644
             (testfile, 'test_help_message'),
         }
     )
+
+
+def test_git_changes_pathspecs(tmpdir):
+    repo = tmpdir.mkdir('git_pathspecs')
+    os.chdir(str(repo))
+    subprocess.check_call(['git', 'init', '-q'])
+    for project in ('one', 'two'):
+        repo.mkdir(project).join('code.py').write('x = 1\n')
+    subprocess.check_call(['git', 'add', '.'])
+    subprocess.check_call([
+        'git', '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+        'commit', '-q', '-m', 'initial',
+    ])
+    for project in ('one', 'two'):
+        repo.join(project, 'code.py').write('x = 2\n')
+
+    changed_files, _ = git.changes_since('HEAD', [str(repo / 'one')])
+
+    assert changed_files == {str(git.find_toplevel() / 'one' / 'code.py')}
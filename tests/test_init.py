@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=missing-docstring
 
+import json
+import subprocess
+
+import pytest
+
+import pytest_fastest
+from pytest_fastest import store
+
 
 def test_help_message(testdir):
     result = testdir.runpytest(
@@ -8,8 +16,13 @@ def test_help_message(testdir):
     )
     # fnmatch_lines does an assertion internally
     result.stdout.fnmatch_lines([
-        '*--fastest-mode={all,skip,gather,cache}',
+        '*--fastest-mode={all,skip,gather,cache,sample}',
         '*--fastest-commit=FASTEST_COMMIT',
+        '*--fastest-project=FASTEST_PROJECT',
+        '*--fastest-sample-rate=FASTEST_SAMPLE_RATE',
+        '*--fastest-shard=INDEX/COUNT',
+        '*--fastest-report*',
+        '*--fastest-report-json=PATH',
     ])
 
 
@@ -39,3 +52,244 @@ def test_fastest_commit_setting(testdir):
 
     # make sure that that we get a '0' exit code for the testsuite
     assert result.ret == 0
+
+
+def test_fastest_report(testdir):
+    testdir.makepyfile("""
+        def test_one():
+            assert True
+    """)
+
+    result = testdir.runpytest(
+        '--fastest-mode=gather', '--fastest-report', '--fastest-report-json=report.json',
+    )
+
+    result.stdout.fnmatch_lines([
+        '*pytest-fastest report*',
+        'traced test runs: *s',
+        'traced tests: 1',
+        'traced function calls: * (tracing overhead about *s)',
+    ])
+    with open(str(testdir.tmpdir / 'report.json')) as infile:
+        report = json.load(infile)
+    assert report['mode'] == 'gather'
+    assert report['traced'] == 1
+    assert report['trace_calls'] > 0
+    assert report['tracing_overhead'] > 0
+    assert set(report['timings']) == {'load coverage', 'traced test runs', 'save coverage'}
+
+
+def test_sample_nodes():
+    coverage = {
+        'test_a.py::test_changed': {'timestamp': 5.0},
+        'test_a.py::test_new': {'timestamp': 4.0},
+        'test_a.py::test_old': {'timestamp': 1.0},
+        'test_a.py::test_older': {'timestamp': 0.5},
+        'test_a.py::test_recent': {'timestamp': 3.0},
+    }
+    reason = store.Reason
+    selected = [
+        ('test_a.py::test_recent', reason.DEPENDENCY_CHANGED),
+        ('test_a.py::test_old', reason.DEPENDENCY_CHANGED),
+        ('test_a.py::test_changed', reason.TEST_CHANGED),
+        ('test_a.py::test_older', reason.PACKAGE_CHANGED),
+        ('test_a.py::test_missing', reason.NO_COVERAGE),
+    ]
+
+    assert pytest_fastest.sample_nodes(coverage, selected, 0.1) == {'test_a.py::test_missing'}
+    assert pytest_fastest.sample_nodes(coverage, selected, 0.6) == {
+        'test_a.py::test_missing', 'test_a.py::test_changed', 'test_a.py::test_older',
+    }
+    assert pytest_fastest.sample_nodes(coverage, selected, 1.0) == {
+        nodeid for nodeid, _ in selected
+    }
+
+
+def test_sample_rate_validation(testdir):
+    result = testdir.runpytest(
+        '--fastest-mode=sample', '--fastest-commit=HEAD', '--fastest-sample-rate=2',
+    )
+
+    assert result.ret == pytest.ExitCode.USAGE_ERROR
+    result.stderr.fnmatch_lines([
+        '*fastest_sample_rate must be greater than 0 and at most 1, not 2.',
+    ])
+
+
+def test_skip_requires_commit(testdir):
+    result = testdir.runpytest('--fastest-mode=skip')
+
+    assert result.ret == pytest.ExitCode.USAGE_ERROR
+    result.stderr.fnmatch_lines(['*Mode skip requires fastest_commit to be set.'])
+
+
+def test_assign_shards():
+    durations = {'a': 5.0, 'b': 4.0, 'c': 3.0, 'd': 3.0, 'e': 2.0, 'f': 1.0}
+
+    assignments = pytest_fastest.assign_shards(durations, 2)
+
+    loads = [0.0, 0.0]
+    for key, index in assignments.items():
+        loads[index] += durations[key]
+    assert loads == [9.0, 9.0]
+    assert pytest_fastest.assign_shards(dict(reversed(list(durations.items()))), 2) == assignments
+
+
+def test_fastest_shard(testdir):
+    testdir.makepyfile(
+        test_grouped="""
+            import pytest
+
+            @pytest.fixture(scope='module')
+            def expensive():
+                return 1
+
+            def test_one(expensive):
+                pass
+
+            def test_two(expensive):
+                pass
+        """,
+        test_single="""
+            def test_three():
+                pass
+
+            def test_four():
+                pass
+        """,
+    )
+
+    ran = []
+    for shard in ('1/2', '2/2'):
+        result = testdir.runpytest('-v', '--fastest-shard={}'.format(shard))
+        assert result.ret == 0
+        ran.append({line.split()[0] for line in result.outlines if ' PASSED' in line})
+
+    assert not ran[0] & ran[1]
+    assert len(ran[0]) == len(ran[1]) == 2
+    assert {'test_grouped.py::test_one', 'test_grouped.py::test_two'} in ran
+
+
+def test_fastest_shard_validation(testdir):
+    result = testdir.runpytest('--fastest-shard=3/2')
+
+    assert result.ret == pytest.ExitCode.USAGE_ERROR
+    result.stderr.fnmatch_lines(['*fastest_shard must look like 2/12, not 3/2.'])
+
+
+def test_parallel_runs_keep_removals(testdir, monkeypatch):
+    testdir.makepyfile(test_parallel="""
+        import os
+        import subprocess
+        import sys
+
+        def test_x():
+            assert not os.environ.get('FAIL_X')
+
+        def test_y():
+            # Run another gather while this one is in progress, with test_x failing
+            if os.environ.get('SPAWN_OTHER'):
+                env = dict(os.environ, FAIL_X='1')
+                del env['SPAWN_OTHER']
+                subprocess.call(
+                    [sys.executable, '-m', 'pytest', '--fastest-mode=gather', '-k', 'test_x'],
+                    env=env,
+                )
+    """)
+    assert testdir.runpytest('--fastest-mode=gather').ret == 0
+
+    monkeypatch.setenv('SPAWN_OTHER', '1')
+    assert testdir.runpytest('--fastest-mode=gather', '-k', 'test_y').ret == 0
+
+    with open(str(testdir.tmpdir / store.STOREFILE)) as infile:
+        assert list(json.load(infile)['coverage']) == ['test_parallel.py::test_y']
+
+
+def test_trivial_test_records_no_packages(testdir):
+    testdir.makepyfile("""
+        def test_nothing():
+            pass
+    """)
+
+    assert testdir.runpytest('--fastest-mode=gather').ret == 0
+
+    with open(str(testdir.tmpdir / store.STOREFILE)) as infile:
+        assert json.load(infile)['dependencies'] == [{'files': [], 'packages': {}}]
+
+
+def test_fastest_shard_package_fixture(testdir):
+    pkg = testdir.mkpydir('pkg')
+    pkg.join('conftest.py').write(
+        'import pytest\n'
+        '\n'
+        '@pytest.fixture(scope="package")\n'
+        'def expensive():\n'
+        '    return 1\n'
+    )
+    for name in ('a', 'b'):
+        pkg.join('test_{}.py'.format(name)).write(
+            'def test_{0}(expensive):\n    pass\n'.format(name)
+        )
+    testdir.makepyfile(test_other='def test_c():\n    pass\n\ndef test_d():\n    pass\n')
+
+    ran = []
+    for shard in ('1/2', '2/2'):
+        result = testdir.runpytest('-v', '--fastest-shard={}'.format(shard))
+        assert result.ret == 0
+        ran.append({line.split()[0] for line in result.outlines if ' PASSED' in line})
+
+    assert {'pkg/test_a.py::test_a', 'pkg/test_b.py::test_b'} in ran
+
+
+def test_fastest_shard_top_level_package_fixture(testdir):
+    tests = testdir.mkpydir('tests')
+    tests.join('conftest.py').write(
+        'import pytest\n'
+        '\n'
+        '@pytest.fixture(scope="package", autouse=True)\n'
+        'def expensive():\n'
+        '    return 1\n'
+    )
+    for name in ('a', 'b', 'c', 'd'):
+        tests.join('test_{}.py'.format(name)).write('def test_{}():\n    pass\n'.format(name))
+
+    ran = []
+    for shard in ('1/2', '2/2'):
+        result = testdir.runpytest('-v', '--fastest-shard={}'.format(shard))
+        assert result.ret == 0
+        ran.append({line.split()[0] for line in result.outlines if ' PASSED' in line})
+
+    assert not ran[0] & ran[1]
+    assert len(ran[0]) == len(ran[1]) == 2
+
+
+def test_fastest_shard_report_counts(testdir):
+    testdir.makepyfile(**{
+        'test_{}'.format(name): 'def test_{}():\n    pass\n'.format(name)
+        for name in ('a', 'b', 'c', 'd')
+    })
+    assert testdir.runpytest('--fastest-mode=gather').ret == 0
+    for command in (
+        ['init', '-q'],
+        ['add', '.'],
+        ['-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-qm', 'base'],
+    ):
+        subprocess.check_call(['git', *command], cwd=str(testdir.tmpdir))
+    testdir.makepyfile(test_new='def test_e():\n    pass\n\ndef test_f():\n    pass\n')
+
+    reports = []
+    for shard in ('1/2', '2/2'):
+        result = testdir.runpytest(
+            # Cache mode doesn't save coverage data that would change the next shard's selection
+            '--fastest-mode=cache',
+            '--fastest-commit=HEAD',
+            '--fastest-shard={}'.format(shard),
+            '--fastest-report-json=report.json',
+        )
+        assert result.ret == 0
+        with open(str(testdir.tmpdir / 'report.json')) as infile:
+            reports.append(json.load(infile))
+
+    assert sum(report['selected'].get('no coverage', 0) for report in reports) == 2
+    assert [report['skipped'] for report in reports] == [4, 0]
+    assert reports[1]['saved'] == 0.0
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+import os
+
+import pytest
+
+from pytest_fastest import packages
+
+
+def test_owner_installed_file():
+    assert packages.owner(os.path.normpath(pytest.__file__)) == 'pytest'
+
+
+def test_owner_project_file():
+    assert packages.owner(os.path.normpath(__file__)) is None
+
+
+def test_versions_for():
+    packaging = pytest.importorskip('packaging')
+
+    assert packages.versions_for([os.path.normpath(packaging.__file__), __file__]) == {
+        'packaging': packages.installed_version('packaging'),
+    }
+
+
+def test_versions_for_skips_harness():
+    assert packages.versions_for([os.path.normpath(pytest.__file__)]) == {}
+
+
+def test_changed_same_version():
+    assert not packages.changed({'pytest': packages.installed_version('pytest')})
+
+
+def test_changed_other_version():
+    assert packages.changed({'pytest': '0.0.0'})
+
+
+def test_changed_uninstalled():
+    assert packages.changed({'surely-not-an-installed-distribution': '1.0'})
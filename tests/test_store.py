@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+from pytest_fastest import store
+
+
+def test_pack_coverage_shares_dependencies():
+    coverage = {
+        'test_a.py::test_a[{}]'.format(i): {
+            'files': ['/src/a.py', '/src/b.py'],
+            'fspath': '/src/test_a.py',
+            'packages': {'requests': '2.0'},
+            'duration': 0.5,
+            'timestamp': 10.0,
+        }
+        for i in range(3)
+    }
+    coverage['test_b.py::test_b'] = {
+        'files': ['/src/b.py'],
+        'fspath': '/src/test_b.py',
+        'packages': {},
+        'duration': 1.5,
+        'timestamp': 20.0,
+    }
+
+    packed = store.pack_coverage(coverage)
+
+    assert packed['fspaths'] == ['/src/test_a.py', '/src/test_b.py']
+    assert packed['dependencies'] == [
+        {'files': ['/src/a.py', '/src/b.py'], 'packages': {'requests': '2.0'}},
+        {'files': ['/src/b.py'], 'packages': {}},
+    ]
+    assert packed['coverage']['test_b.py::test_b'] == {
+        'fspath': 1, 'dependencies': 1, 'duration': 1.5, 'timestamp': 20.0,
+    }
+
+    unpacked = store.unpack_coverage(packed)
+    assert unpacked == coverage
+    assert unpacked['test_a.py::test_a[0]']['files'] is unpacked['test_a.py::test_a[2]']['files']
+
+
+def covdata(timestamp, files=('/src/a.py',)):
+    return {
+        'files': list(files),
+        'fspath': '/src/test_a.py',
+        'packages': {},
+        'duration': 0.1,
+        'timestamp': timestamp,
+    }
+
+
+def test_coverage_roundtrip(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    coverage = {'test_a.py::test_a': covdata(1.0)}
+
+    store.save_coverage(coverage)
+
+    assert store.load_coverage() == coverage
+
+
+def test_merge_coverage():
+    ours = {
+        'test_a.py::test_new': covdata(2.0, ['/src/new.py']),
+        'test_a.py::test_old': covdata(1.0, ['/src/old.py']),
+        'test_a.py::test_ours': covdata(1.0),
+    }
+    theirs = {
+        'test_a.py::test_new': covdata(1.0),
+        'test_a.py::test_old': covdata(2.0),
+        'test_a.py::test_removed': covdata(1.0),
+        'test_a.py::test_readded': covdata(3.0),
+        'test_a.py::test_theirs': covdata(1.0),
+    }
+    removed = {'test_a.py::test_removed': 2.0, 'test_a.py::test_readded': 2.0}
+
+    assert store.merge_coverage(ours, theirs, removed) == {
+        'test_a.py::test_new': covdata(2.0, ['/src/new.py']),
+        'test_a.py::test_old': covdata(2.0),
+        'test_a.py::test_ours': covdata(1.0),
+        'test_a.py::test_readded': covdata(3.0),
+        'test_a.py::test_theirs': covdata(1.0),
+    }
+
+
+def test_save_coverage_merges(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+
+    store.save_coverage({'test_a.py::test_a': covdata(1.0)})
+    store.save_coverage({'test_a.py::test_b': covdata(1.0)})
+
+    assert set(store.load_coverage()) == {'test_a.py::test_a', 'test_a.py::test_b'}
+
+
+def test_selector_reasons():
+    coverage = {
+        'test_a.py::test_a[0]': {
+            'files': ['/src/a.py'], 'fspath': '/src/test_a.py', 'packages': {}, 'duration': 0.1,
+        },
+        'test_a.py::test_b': {
+            'files': ['/src/b.py'], 'fspath': '/src/test_a.py', 'packages': {}, 'duration': 0.1,
+        },
+        'test_a.py::test_c': {
+            'files': ['/src/c.py'],
+            'fspath': '/src/test_a.py',
+            'packages': {'surely-not-an-installed-distribution': '1.0'},
+            'duration': 0.1,
+        },
+        'test_a.py::test_d': {
+            'files': ['/src/c.py'], 'fspath': '/src/test_a.py', 'packages': {}, 'duration': 0.1,
+        },
+    }
+    selector = store.Selector(
+        coverage, {'/src/b.py'}, {('/src/test_a.py', 'test_a')},
+    )
+
+    def reason(nodeid):
+        return selector.reason(nodeid, '/src/test_a.py')
+
+    assert reason('test_a.py::test_a[0]') == store.Reason.TEST_CHANGED
+    assert reason('test_a.py::test_b') == store.Reason.DEPENDENCY_CHANGED
+    assert reason('test_a.py::test_c') == store.Reason.PACKAGE_CHANGED
+    assert reason('test_a.py::test_d') is None
+    assert reason('test_a.py::test_e') == store.Reason.NO_COVERAGE
+
+
+def test_project_pathspecs():
+    coverage = {
+        'test_a.py::test_a': covdata(1.0, ['/repo/one/a.py', '/repo/two/b.py']),
+        'test_a.py::test_b': covdata(1.0, ['/repo/one/sub/c.py', '/repo/three/d.py']),
+        'test_a.py::test_c': covdata(1.0, ['/repo/shared.py']),
+    }
+
+    assert store.project_pathspecs(coverage, '/repo/one') == [
+        '/repo/one', '/repo/shared.py', '/repo/three', '/repo/two',
+    ]